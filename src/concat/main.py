@@ -1,15 +1,19 @@
 """Main module for concatenating H5 files into chunks."""
-from typing import Union, Tuple
-from datetime import datetime, timedelta
+from typing import Deque, Union, Tuple
+from collections import deque
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
 import os
 import json
+import logging
+import math
+import time
 
 import h5py
 import numpy as np
-import pytz
 
 from log.main_logger import logger as log
-from concat.utils import multithreaded_mean
+from concat.utils import multithreaded_mean, get_compression_kwargs
 from config import (
     SYSTEM_NAME,
     CHUNK_SIZE,
@@ -17,8 +21,24 @@ from config import (
     DX,
     LOCAL_PATH,
     SAVE_PATH,
+    COMPRESSION,
 )
 
+# HDF5 raw data chunk cache used when reading packets. Default 1 MiB cache is
+# smaller than a single packet, so chunked inputs would be decompressed and
+# re-read repeatedly. Number of slots should be a prime number.
+INPUT_RDCC_NBYTES = 64 * 1024 * 1024
+INPUT_RDCC_NSLOTS = 12007
+# Packets are read only once, so fully read chunks can be evicted first
+INPUT_RDCC_W0 = 1.0
+# Status files used to resume concatenation between runs
+LAST_PATH = os.path.join(SAVE_PATH, "last")
+CARRY_PATH = os.path.join(SAVE_PATH, "carry.npy")
+# Prisma packet names are in local time
+PRISMA_TZ = ZoneInfo("Asia/Jerusalem")
+# Target size of HDF5 chunk of saved data, matching default 1 MiB chunk cache
+OUTPUT_CHUNK_BYTES = 1024 * 1024
+
 
 class Concatenator:
     """Class responsible for concatenating H5 files into chunks.
@@ -48,10 +68,17 @@ class Concatenator:
         self.sps: int = 0
         self.dx: int = 0
         self.time_seconds: int = 0
+        self.traces: int = 0
 
         self.system = None
         self.num_threads = num_threads
 
+        self.read_buffer: Union[None, np.ndarray] = None
+        self.chunk_buffer: Union[None, np.ndarray] = None
+        # Last read json file, shared by all packets of directory in some systems
+        self.attrs_cache: Tuple[Union[None, str], dict] = (None, {})
+        self.compression_kwargs: dict = get_compression_kwargs(COMPRESSION)
+
         self.run()
 
     def read_attrs(self, file_path: str) -> dict:
@@ -66,10 +93,13 @@ class Concatenator:
             FileNotFoundError: If the file is not found.
         """
         try:
-            with open(
-                os.path.join(LOCAL_PATH, file_path), "r", encoding="utf-8"
-            ) as json_file:
-                attrs = json.load(fp=json_file)
+            if self.attrs_cache[0] != file_path:
+                with open(
+                    os.path.join(LOCAL_PATH, file_path), "r", encoding="utf-8"
+                ) as json_file:
+                    self.attrs_cache = (file_path, json.load(fp=json_file))
+            # Copy, as attrs are updated in place while processing the packet
+            attrs = dict(self.attrs_cache[1])
 
             return attrs
         except FileNotFoundError as e:
@@ -105,36 +135,41 @@ class Concatenator:
         return True
 
     def _get_next_packet_data(
-        self, h5_files_list: list
-    ) -> Tuple[Union[str, None], Union[np.ndarray, None], bool]:
+        self, h5_files_list: Deque[list]
+    ) -> Tuple[
+        Union[str, None],
+        Union[str, None],
+        Union[float, None],
+        Union[np.ndarray, None],
+        bool,
+    ]:
         """Get the data from the next H5 file in the list.
 
         Args:
-            h5_files_list (list): List of H5 file paths.
+            h5_files_list (deque): Queue of H5 file dirs, names and timestamps.
 
         Returns:
-            tuple: A tuple containing the file name, data,
+            tuple: A tuple containing the file dir, name, timestamp, data,
                 and a flag indicating if there is a gap between files.
         """
         data: np.ndarray
-        return_tuple = (None, None, None, False)  # name, data, gap
+        return_tuple = (None, None, None, None, False)  # dir, name, time, data, gap
         if len(h5_files_list) > 1:
-            file_dir, file_name = h5_files_list[-1]
-            self._calculate_attrs(file_dir, file_name)
+            file_dir, file_name, file_timestamp = h5_files_list[0]
+            self._calculate_attrs(file_dir, file_name, file_timestamp)
             log.debug("Checking file: %s", file_name)
-            file_timestamp = self._get_file_timestamp(file_name)
             data = self._read_data(file_dir, file_name)
             self._check_shape_consistency(data)
 
-            next_file_dir, next_file_name = h5_files_list[-2]
-            next_file_timestamp = self._get_file_timestamp(next_file_name)
-            if np.round(next_file_timestamp - file_timestamp) > self.time_seconds:
+            next_file_dir, next_file_name, next_file_timestamp = h5_files_list[1]
+            self._prefetch_file(next_file_dir, next_file_name)
+            if round(next_file_timestamp - file_timestamp) > self.time_seconds:
                 log.critical(
                     "Data has gap between %s and %s", file_name, next_file_name
                 )
-                return_tuple = (file_dir, file_name, data, True)
+                return_tuple = (file_dir, file_name, file_timestamp, data, True)
             else:
-                file_time_diff = int(np.round(next_file_timestamp - file_timestamp, 0))
+                file_time_diff = round(next_file_timestamp - file_timestamp)
                 split_before = int(SPS * file_time_diff)
                 log.debug(
                     "Cutting data after: %s seconds or %s samples",
@@ -143,24 +178,54 @@ class Concatenator:
                 )
                 data = data[:, :split_before]
                 log.debug("Data shape after cutting: %s", data.shape)
-                return_tuple = (file_dir, file_name, data[:, :split_before], False)
+                return_tuple = (
+                    file_dir,
+                    file_name,
+                    file_timestamp,
+                    data[:, :split_before],
+                    False,
+                )
 
         else:
-            file_dir, file_name = h5_files_list[-1]
-            self._calculate_attrs(file_dir, file_name)
+            file_dir, file_name, file_timestamp = h5_files_list[0]
+            self._calculate_attrs(file_dir, file_name, file_timestamp)
             log.debug("Last file: %s", file_name)
             data = self._read_data(file_dir, file_name)
             self._check_shape_consistency(data)
-            return_tuple = (file_dir, file_name, data, True)
+            return_tuple = (file_dir, file_name, file_timestamp, data, True)
 
         return return_tuple
 
+    def _prefetch_file(self, file_dir: str, file_name: str) -> None:
+        """Ask the OS to read the file into page cache in background.
+
+        Next packet is read from disk while the current one is processed.
+        Readahead is used instead of a reading thread because h5py holds
+        the GIL during reads, so the thread would not overlap with processing.
+
+        Args:
+            file_dir (str): The file directory.
+            file_name (str): The file name.
+        """
+        if not hasattr(os, "posix_fadvise"):
+            return
+        try:
+            fd = os.open(os.path.join(LOCAL_PATH, file_dir, file_name), os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+        except OSError as err:
+            # Prefetch is only a hint, errors are reported by the actual read
+            log.debug("Prefetch of %s failed: %s", file_name, err)
+
     def _resample_data(self, data: np.ndarray) -> np.ndarray:
         if self.sps / SPS >= 2:
             time_down_factor = int(self.sps / SPS)
             log.debug("Resampling time axis by factor %s", time_down_factor)
             self.attrs["down_factor_time"] = time_down_factor
-            data = data.reshape(data.shape[0], -1, time_down_factor).copy()
+            # Reshape is a view for contiguous data and copies only otherwise
+            data = data.reshape(data.shape[0], -1, time_down_factor)
 
             # data = multithreaded_mean(data, 10)
             # data = np.mean(data, axis=-1, dtype=np.float32)
@@ -179,11 +244,11 @@ class Concatenator:
             self.dx = DX
         return data
 
-    def _fill_attrs(self, file_name: str):
+    def _fill_attrs(self, file_timestamp: float):
         self.attrs["prr_down"] = SPS
         self.attrs["dx_down"] = DX
 
-        self.attrs["packet_time_down"] = self._get_file_timestamp(file_name)
+        self.attrs["packet_time_down"] = file_timestamp
 
     def _data_preprocess(self, data: np.ndarray, file_name: str) -> np.ndarray:
         if SPS != self.sps or DX != self.dx:
@@ -203,16 +268,40 @@ class Concatenator:
         """
         file_path = os.path.join(file_dir, file_name)
         if self.system == "Mekorot":
-            data = h5py.File(os.path.join(LOCAL_PATH, file_path), "r")["data_down"][
-                ()
-            ].T
-        elif self.system == "Prisma":
-            with open(
+            with h5py.File(
                 os.path.join(LOCAL_PATH, file_path),
-                "rb",
-            ) as f:
-                f.seek(3714)
-                traces = np.frombuffer(f.read(2), dtype=np.int16)[0]
+                "r",
+                rdcc_nbytes=INPUT_RDCC_NBYTES,
+                rdcc_nslots=INPUT_RDCC_NSLOTS,
+                rdcc_w0=INPUT_RDCC_W0,
+            ) as file:
+                dset = file["data_down"]
+                # Offset is known only for contiguous datasets without filters
+                offset = dset.id.get_offset()
+                if offset is not None:
+                    # Map contiguous data directly, bypassing HDF5 buffering
+                    data = np.memmap(
+                        os.path.join(LOCAL_PATH, file_path),
+                        dtype=dset.dtype,
+                        mode="r",
+                        offset=offset,
+                        shape=dset.shape,
+                    ).T
+                else:
+                    # Reuse the read buffer between packets of the same shape
+                    if (
+                        self.read_buffer is None
+                        or self.read_buffer.shape != dset.shape
+                        or self.read_buffer.dtype != dset.dtype
+                    ):
+                        log.debug("Allocating read buffer of shape %s", dset.shape)
+                        self.read_buffer = np.empty(dset.shape, dtype=dset.dtype)
+                    dset.read_direct(self.read_buffer)
+                    data = self.read_buffer.T
+        elif self.system == "Prisma":
+            # Number of samples per trace is taken from the info file
+            # of the directory instead of the SEGY trace header
+            traces = self.traces
             log.debug("Number of traces: %s", traces)
             mmap_dtype = np.dtype(
                 # 240 bytes for the header, then the data
@@ -230,36 +319,82 @@ class Concatenator:
 
         return self._data_preprocess(data, file_name)
 
+    def _get_output_chunks(self, chunk_data: np.ndarray) -> Union[None, tuple]:
+        """Get HDF5 chunk shape for the saved data.
+
+        Chunk spans all space samples and as many time samples as fit into
+        OUTPUT_CHUNK_BYTES, so reading a time window touches few chunks.
+
+        Args:
+            chunk_data (np.ndarray): The data to be saved.
+
+        Returns:
+            tuple: Chunk shape, or None if the data is empty.
+        """
+        if chunk_data.size == 0:
+            return None
+        space_samples, time_samples = chunk_data.shape
+        chunk_time_samples = OUTPUT_CHUNK_BYTES // (space_samples * chunk_data.itemsize)
+        return (space_samples, max(1, min(time_samples, chunk_time_samples)))
+
+    def _get_save_dir(self, chunk_time: float) -> str:
+        """Get directory of the chunk: SAVE_PATH/YYYY/YYYYMMDD (UTC).
+
+        Args:
+            chunk_time (float): Timestamp of the beginning of the chunk.
+
+        Returns:
+            str: The directory path.
+        """
+        date = time.strftime("%Y%m%d", time.gmtime(chunk_time))
+        return os.path.join(SAVE_PATH, date[:4], date)
+
+    def _get_next_day(self, timestamp: float) -> int:
+        """Get timestamp of the UTC midnight following the given timestamp.
+
+        Args:
+            timestamp (float): The timestamp.
+
+        Returns:
+            int: The next UTC midnight timestamp.
+        """
+        # UTC days have no DST or leap seconds in Unix time, so each is 86400 s
+        return (math.floor(timestamp) // 86400 + 1) * 86400
+
     def _save_chunk_data(self, chunk_data: np.ndarray) -> None:
         log.info("Saving chunk data to %s.h5", self.chunk_time_str)
         log.info("Chunk data shape: %s", chunk_data.shape)
-        date_datetime = datetime.fromtimestamp(
-            float(self.chunk_time_str), tz=pytz.UTC
-        ).date()
-        year = date_datetime.strftime("%Y")
-        date = date_datetime.strftime("%Y%m%d")
-        save_path = os.path.join(SAVE_PATH, year, date)
+        save_path = self._get_save_dir(float(self.chunk_time_str))
         if not os.path.exists(save_path):
-            os.makedirs(os.path.join(SAVE_PATH, year, date))
-        file = h5py.File(os.path.join(save_path, self.chunk_time_str + ".h5"), "w")
-        file["data_down"] = chunk_data
-
-        file.attrs.update(self.attrs)
-        if os.path.exists(os.path.join(SAVE_PATH, "last")):
-            os.remove(os.path.join(SAVE_PATH, "last"))
-            log.debug("Removing last after saving chunk data")
-
-        with open(os.path.join(SAVE_PATH, "last"), "w", encoding="utf-8") as f:
+            os.makedirs(save_path)
+        with h5py.File(
+            os.path.join(save_path, self.chunk_time_str + ".h5"), "w"
+        ) as file:
+            file.create_dataset(
+                "data_down",
+                data=chunk_data,
+                chunks=self._get_output_chunks(chunk_data),
+                track_times=False,
+                **self.compression_kwargs,
+            )
+            file.attrs.update(self.attrs)
+        # Write status to temporary file and atomically replace the previous one
+        # so that crash during writing will not leave empty or truncated status
+        with open(LAST_PATH + ".tmp", "w", encoding="utf-8") as f:
             f.writelines([f"{self.chunk_time}\n", f"{self.chunk_data_offset}\n"])
+        os.replace(LAST_PATH + ".tmp", LAST_PATH)
+        log.debug("Updated last after saving chunk data")
         if self.carry is not None:
             log.debug("Saving carry data to carry file")
-            np.save(os.path.join(SAVE_PATH, "carry.npy"), self.carry)
+            np.save(CARRY_PATH, self.carry)
 
-    def _calculate_attrs(self, file_dir, file_name) -> None:
+    def _calculate_attrs(self, file_dir, file_name, file_timestamp) -> None:
         """Calculate the attributes based on the file path.
 
         Args:
-            file_path (str): The file path.
+            file_dir (str): The file directory.
+            file_name (str): The file name.
+            file_timestamp (float): The packet timestamp parsed from the file name.
 
         Returns:
             None
@@ -296,10 +431,11 @@ class Concatenator:
             self.sps = self.attrs["prr"]
             self.dx = self.attrs["dx"]
             self.space_samples = self.attrs["numSamplesPerTrace"]
+            self.traces = int(self.attrs["numTraces"])
             self.time_samples = int(self.attrs["numTraces"] / (self.sps / SPS))
             self.time_seconds = self.time_samples / SPS
 
-        self._fill_attrs(file_name)
+        self._fill_attrs(file_timestamp)
         log.debug("Expected data shape: %s, %s", self.space_samples, self.time_samples)
 
     def _cut_chunk_to_size(self, chunk_data: np.ndarray) -> np.ndarray:
@@ -307,17 +443,13 @@ class Concatenator:
         return chunk_data[:, : self.chunk_data_offset]
 
     def _get_previous_file_data(self):
-        if os.path.exists(os.path.join(SAVE_PATH, "last")):
-            with open(os.path.join(SAVE_PATH, "last"), "r", encoding="utf-8") as f:
+        if os.path.exists(LAST_PATH):
+            with open(LAST_PATH, "r", encoding="utf-8") as f:
                 chunk_time, chunk_data_offset = [x.strip() for x in f.readlines()]
                 chunk_data_offset = int(chunk_data_offset)
                 chunk_time = float(chunk_time)
-                chunk_datetime = datetime.fromtimestamp(chunk_time, tz=pytz.UTC)
                 chunk_end_time = chunk_time + (chunk_data_offset / SPS)
-                next_day = (
-                    chunk_datetime.replace(hour=0, minute=0, second=0, microsecond=0)
-                    + timedelta(days=1)
-                ).timestamp()
+                next_day = self._get_next_day(chunk_time)
                 if (
                     chunk_data_offset == int(CHUNK_SIZE * SPS)
                     or chunk_end_time >= next_day
@@ -325,11 +457,11 @@ class Concatenator:
                     log.debug("Skipping restoration")
                     log.debug("Chunk time %s", chunk_time)
                     log.debug("Loading carry data")
-                    if os.path.exists(os.path.join(SAVE_PATH, "carry.npy")):
+                    if os.path.exists(CARRY_PATH):
                         log.debug("Loading carry data")
-                        self.old_carry = np.load(os.path.join(SAVE_PATH, "carry.npy"))
+                        self.old_carry = np.load(CARRY_PATH)
                         self.carry = self.old_carry
-                        os.remove(os.path.join(SAVE_PATH, "carry.npy"))
+                        os.remove(CARRY_PATH)
                         log.debug("Removing carry file")
                     else:
                         self.carry = None
@@ -347,10 +479,22 @@ class Concatenator:
 
         return chunk_time, chunk_data_offset
 
+    def _get_chunk_buffer(self) -> np.ndarray:
+        """Get the chunk array, reusing it between chunks of the same shape.
+
+        Chunk is saved before the next one is filled, so the array is free to reuse.
+
+        Returns:
+            np.ndarray: The chunk array of shape (space_samples, CHUNK_SIZE * SPS).
+        """
+        shape = (int(self.space_samples), int(CHUNK_SIZE * SPS))
+        if self.chunk_buffer is None or self.chunk_buffer.shape != shape:
+            log.debug("Allocating chunk buffer of shape %s", shape)
+            self.chunk_buffer = np.empty(shape, dtype=np.float32)
+        return self.chunk_buffer
+
     def _allocate_empty_chunk(self):
-        chunk_data = np.empty(
-            (self.space_samples, int(CHUNK_SIZE * SPS)), dtype=np.float32
-        )
+        chunk_data = self._get_chunk_buffer()
         self.chunk_data_offset = 0
         self.till_next_chunk = CHUNK_SIZE
         self.new_chunk = True
@@ -359,37 +503,23 @@ class Concatenator:
 
     def _restore_previous_chunk(self, previous_chunk_time, previous_chunk_data_offset):
         previous_chunk_time = float(previous_chunk_time)
-        chunk_datetime = datetime.fromtimestamp(previous_chunk_time, tz=pytz.UTC).date()
-        chunk_date = chunk_datetime.strftime("%Y%m%d")
-        chunk_year = chunk_datetime.strftime("%Y")
         chunk_path = os.path.join(
-            SAVE_PATH, chunk_year, chunk_date, str(previous_chunk_time) + ".h5"
+            self._get_save_dir(previous_chunk_time), str(previous_chunk_time) + ".h5"
         )
         log.debug("Loading chunk data from %s", chunk_path)
         try:
-            chunk_data: np.ndarray = h5py.File(chunk_path, "r")["data_down"][()]
-            # Resize chunk to SPS * CHUNK_SIZE
-            chunk_data = np.hstack(
-                (
-                    chunk_data,
-                    np.zeros(
-                        (
-                            self.space_samples,
-                            int((SPS * CHUNK_SIZE) - chunk_data.shape[1]),
-                        ),
-                        dtype=np.float32,
-                    ),
-                )
-            )
+            # Read saved data into the beginning of the chunk. The rest is not
+            # zeroed, as only columns before the chunk offset are ever saved
+            chunk_data = self._get_chunk_buffer()
+            with h5py.File(chunk_path, "r") as file:
+                dset = file["data_down"]
+                # Empty selection is rejected by h5py, saved chunk may have no samples
+                if dset.shape[1] > 0:
+                    dset.read_direct(chunk_data, dest_sel=np.s_[:, : dset.shape[1]])
 
             log.debug("Chunk data shape: %s", chunk_data.shape)
 
-            next_day = (
-                datetime.fromtimestamp(previous_chunk_time, tz=pytz.UTC).replace(
-                    hour=0, minute=0, second=0, microsecond=0
-                )
-                + timedelta(days=1)
-            ).timestamp()
+            next_day = self._get_next_day(previous_chunk_time)
             self.chunk_to_next_day = next_day - previous_chunk_time
 
             self.chunk_data_offset = previous_chunk_data_offset
@@ -417,74 +547,106 @@ class Concatenator:
     def _get_files(self, previous_chunk_time, previous_chunk_data_offset):
         h5_files_list = []
         if self.system == "Mekorot":
-            today = datetime.now(tz=pytz.UTC).date().strftime("%Y%m%d")
-            dirs = [
-                dir
-                for dir in os.listdir(LOCAL_PATH)
-                if os.path.isdir(os.path.join(LOCAL_PATH, dir)) and dir != today
-            ]
+            today = datetime.now(tz=timezone.utc).date().strftime("%Y%m%d")
+            with os.scandir(LOCAL_PATH) as entries:
+                dirs = [
+                    entry.name
+                    for entry in entries
+                    if entry.is_dir() and entry.name != today
+                ]
+            if previous_chunk_time:
+                # Skip day directories older than the resume point without listing
+                # them, one day of margin covers directories named in local time
+                first_day = time.strftime(
+                    "%Y%m%d", time.gmtime(previous_chunk_time - 86400)
+                )
+                dirs = [
+                    dir_name
+                    for dir_name in dirs
+                    if not (
+                        len(dir_name) == 8
+                        and dir_name.isdigit()
+                        and dir_name < first_day
+                    )
+                ]
 
             for dir_path in sorted(dirs):
                 for root, dirs, files in os.walk(os.path.join(LOCAL_PATH, dir_path)):
                     files = [file for file in files if file.endswith(".h5")]
-                    for file in sorted(
-                        files, key=lambda x: int(x.split("_")[-1].split(".")[0])
-                    ):
-                        if file.endswith(".h5") and float(
-                            file.split("_")[-1].rsplit(".", 1)[0]
-                        ) >= np.floor(previous_chunk_time) + (
-                            previous_chunk_data_offset / SPS
-                        ):
-                            h5_files_list.append([dir_path, file])
+                    # Parse timestamps once, then sort and filter them as array
+                    file_timestamps = np.fromiter(
+                        (self._get_file_timestamp(file) for file in files),
+                        dtype=np.float64,
+                        count=len(files),
+                    )
+                    order = np.argsort(file_timestamps, kind="stable")
+                    start = np.searchsorted(
+                        file_timestamps[order],
+                        math.floor(previous_chunk_time)
+                        + (previous_chunk_data_offset / SPS),
+                    )
+                    h5_files_list.extend(
+                        [dir_path, files[i], file_timestamps[i].item()]
+                        for i in order[start:]
+                    )
         elif self.system == "Prisma":
-            today = datetime.now(tz=pytz.UTC).replace(
+            today = datetime.now(tz=timezone.utc).replace(
                 hour=0, minute=0, second=0, microsecond=0
             )
-            dirs = [
-                dir
-                for dir in os.listdir(LOCAL_PATH)
-                if (
-                    os.path.isdir(os.path.join(LOCAL_PATH, dir))
-                    and os.path.getmtime(os.path.join(LOCAL_PATH, dir))
-                    < today.timestamp()
-                )
-            ]
-
-            for dir_path in sorted(
-                dirs, key=lambda x: os.path.getmtime(os.path.join(LOCAL_PATH, x))
-            ):
+            # DirEntry caches stat result, so mtime is read once per directory
+            with os.scandir(LOCAL_PATH) as entries:
+                dirs = [
+                    entry
+                    for entry in entries
+                    if entry.is_dir() and entry.stat().st_mtime < today.timestamp()
+                ]
+
+            for dir_path in [
+                entry.name for entry in sorted(dirs, key=lambda x: x.stat().st_mtime)
+            ]:
                 for root, dirs, files in os.walk(os.path.join(LOCAL_PATH, dir_path)):
-                    files = [file for file in files if file.endswith(".segy")]
-                    for file in sorted(
-                        files, key=lambda x: self._get_file_timestamp(x)
-                    ):
-                        file_timestamp = self._get_file_timestamp(file)
-                        if file.endswith(".segy") and file_timestamp >= np.floor(
-                            previous_chunk_time
-                        ) + (previous_chunk_data_offset / SPS):
-                            h5_files_list.append([dir_path, file])
-        # FIFO: reverse list
+                    # Parse timestamp once per file for both sorting and filtering
+                    files = sorted(
+                        (self._get_file_timestamp(file), file)
+                        for file in files
+                        if file.endswith(".segy")
+                    )
+                    for file_timestamp, file in files:
+                        if file_timestamp >= math.floor(previous_chunk_time) + (
+                            previous_chunk_data_offset / SPS
+                        ):
+                            h5_files_list.append([dir_path, file, file_timestamp])
         log.debug("Files to process: %s", len(h5_files_list))
-        h5_files_list = h5_files_list[::-1]
-        return h5_files_list
+        # FIFO: files are consumed from the left
+        return deque(h5_files_list)
 
     def _get_file_timestamp(self, file_name: str):
         if self.system == "Mekorot":
             file_timestamp = float(file_name.split("_")[-1].rsplit(".", 1)[0])
         elif self.system == "Prisma":
-            file_datetime = datetime.strptime(
-                file_name.split(".")[0], "%Y-%m-%dT%H-%M-%S-%f"
+            # Name is %Y-%m-%dT%H-%M-%S-%f, sliced by hand as strptime is slow
+            name = file_name.split(".")[0]
+            file_datetime = datetime(
+                int(name[0:4]),
+                int(name[5:7]),
+                int(name[8:10]),
+                int(name[11:13]),
+                int(name[14:16]),
+                int(name[17:19]),
+                int(name[20:26].ljust(6, "0")),
+                tzinfo=PRISMA_TZ,
             )
-            file_datetime = pytz.timezone("Asia/Jerusalem").localize(file_datetime)
-            file_datetime_utc = file_datetime.astimezone(pytz.UTC)
-            file_timestamp = file_datetime_utc.timestamp()
+            # Ambiguous local time at DST end resolves to standard time
+            if file_datetime.dst():
+                file_datetime = file_datetime.replace(fold=1)
+            file_timestamp = file_datetime.timestamp()
         else:
             raise ValueError("System not supported")
         return file_timestamp
 
     def _fill_chunk_data(
         self,
-        h5_files_list: list,
+        h5_files_list: Deque[list],
         chunk_data,
         previous_chunk_time,
         previous_chunk_data_offset,
@@ -493,9 +655,13 @@ class Concatenator:
         while True:
             self.till_next_chunk = CHUNK_SIZE - self.chunk_data_offset / SPS
             # Get next file data
-            file_dir, file_name, data, is_chunk_stop = self._get_next_packet_data(
-                h5_files_list
-            )
+            (
+                file_dir,
+                file_name,
+                file_timestamp,
+                data,
+                is_chunk_stop,
+            ) = self._get_next_packet_data(h5_files_list)
             if data.shape[0] != chunk_data.shape[0]:
                 log.warning(
                     "Data shape mismatch: %s, %s",
@@ -506,11 +672,14 @@ class Concatenator:
                 break
             start_split_index = 0
             end_split_index = data.shape[1]
-            if int(
-                self.chunk_time
-                + (self.chunk_data_offset / self.sps)
-                - self.time_seconds
-            ) >= self._get_file_timestamp(file_name):
+            if (
+                int(
+                    self.chunk_time
+                    + (self.chunk_data_offset / self.sps)
+                    - self.time_seconds
+                )
+                >= file_timestamp
+            ):
                 log.debug("Skipping %s", file_name)
                 continue
             log.debug("Concatenating %s", file_name)
@@ -527,94 +696,77 @@ class Concatenator:
                     self.carry = None
                 else:
                     log.debug("Loaded time from packet name")
-                    self.chunk_time = self._get_file_timestamp(file_name)
+                    self.chunk_time = file_timestamp
                 # Time drift correction
                 self.chunk_time = (
-                    np.floor(self.chunk_time)
-                    + self._get_file_timestamp(file_name)
-                    - np.floor(self._get_file_timestamp(file_name))
+                    math.floor(self.chunk_time)
+                    + file_timestamp
+                    - math.floor(file_timestamp)
                 )
 
-                next_day = (
-                    datetime.fromtimestamp(self.chunk_time, tz=pytz.UTC).replace(
-                        hour=0, minute=0, second=0
-                    )
-                    + timedelta(days=1)
-                ).timestamp()
+                next_day = self._get_next_day(self.chunk_time)
                 log.debug("New chunk time: %s", self.chunk_time)
-                log.debug(
-                    "Chunk datetime: %s",
-                    datetime.fromtimestamp(self.chunk_time, tz=pytz.UTC).strftime(
-                        "%Y-%m-%d %H:%M:%S"
-                    ),
-                )
-                log.debug(
-                    "Next day datetime: %s",
-                    datetime.fromtimestamp(next_day, tz=pytz.UTC).strftime(
-                        "%Y-%m-%d %H:%M:%S"
-                    ),
-                )
-                self.chunk_to_next_day = np.round(next_day - self.chunk_time)
+                # Formatting datetimes is not free, skip it if it won't be logged
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug(
+                        "Chunk datetime: %s",
+                        datetime.fromtimestamp(
+                            self.chunk_time, tz=timezone.utc
+                        ).strftime("%Y-%m-%d %H:%M:%S"),
+                    )
+                    log.debug(
+                        "Next day datetime: %s",
+                        datetime.fromtimestamp(next_day, tz=timezone.utc).strftime(
+                            "%Y-%m-%d %H:%M:%S"
+                        ),
+                    )
+                # Whole seconds till midnight, as chunk is aligned to packet fraction
+                self.chunk_to_next_day = next_day - math.floor(self.chunk_time)
                 self.chunk_time_str = str(self.chunk_time)
                 self.new_chunk = False
 
-                date_datetime = datetime.fromtimestamp(
-                    self.chunk_time, tz=pytz.UTC
-                ).date()
-                year = date_datetime.strftime("%Y")
-                date = date_datetime.strftime("%Y%m%d")
-                if not os.path.exists(os.path.join(SAVE_PATH, year, date)):
-                    os.makedirs(os.path.join(SAVE_PATH, year, date))
+                save_dir = self._get_save_dir(self.chunk_time)
+                if not os.path.exists(save_dir):
+                    os.makedirs(save_dir)
 
                 # with open(
-                #     os.path.join(SAVE_PATH, year, date, self.chunk_time_str + ".json"),
+                #     os.path.join(save_dir, self.chunk_time_str + ".json"),
                 #     "w",
                 #     encoding="utf-8",
                 # ) as f:
                 #     json.dump(self.attrs, f)
 
+            # Current end of the chunk, offset is fixed until the packet is added
+            chunk_end_time = self.chunk_time + (self.chunk_data_offset / self.sps)
             self.till_next_day = round(
                 self.chunk_to_next_day - self.chunk_data_offset / self.sps, 0
             )
-            if (
-                np.round(
-                    self.chunk_time
-                    + (self.chunk_data_offset / self.sps)
-                    - self._get_file_timestamp(file_name)
-                )
-                >= 1
-            ):
-                start_split_index = int(
-                    self.sps
-                    * (
-                        np.round(
-                            self.chunk_time
-                            + (self.chunk_data_offset / self.sps)
-                            - self._get_file_timestamp(file_name)
-                        )
-                    )
-                )
+            # Seconds of the packet already covered by the chunk
+            packet_overlap = round(chunk_end_time - file_timestamp)
+            if packet_overlap >= 1:
+                start_split_index = int(self.sps * packet_overlap)
                 log.debug(
                     "Splitting to next packet: start split offset %s",
                     start_split_index,
                 )
-            if self.till_next_day < data.shape[1] / self.sps:
+            data_seconds = data.shape[1] / self.sps
+            if self.till_next_day < data_seconds:
                 end_split_index = int(self.sps * self.till_next_day)
                 log.debug(
                     "Splitting to next day: time till midnight %s",
                     self.till_next_day,
                 )
                 log.debug("Splitting to next day: split offset %s", end_split_index)
-                self.carry = data[:, end_split_index:]
+                self.carry = data[:, end_split_index:].copy()
                 is_chunk_stop = True
-            elif self.till_next_chunk < data.shape[1] / self.sps:
+            elif self.till_next_chunk < data_seconds:
                 end_split_index = int(self.sps * self.till_next_chunk)
                 log.debug(
                     "Splitting to next chunk: time till next chunk %s",
                     self.till_next_chunk,
                 )
                 log.debug("Splitting to next chunk: split offset %s", end_split_index)
-                self.carry = data[:, end_split_index:]
+                self.carry = data[:, end_split_index:].copy()
 
                 is_chunk_stop = True
             else:
@@ -628,24 +780,16 @@ class Concatenator:
 
             if (
                 np.round(
-                    self.chunk_time
-                    + (self.chunk_data_offset / self.sps)
-                    - (
-                        self._get_file_timestamp(file_name)
-                        + (start_split_index / self.sps)
-                    ),
+                    chunk_end_time - (file_timestamp + (start_split_index / self.sps)),
                     1,
                 )
                 > 0.5
             ):
                 log.debug("Time inconsistency between chunk and packet")
-                log.debug(
-                    "Chunk time: %s",
-                    self.chunk_time + (self.chunk_data_offset / self.sps),
-                )
+                log.debug("Chunk time: %s", chunk_end_time)
                 log.debug(
                     "Packet time: %s",
-                    self._get_file_timestamp(file_name) + start_split_index / self.sps,
+                    file_timestamp + start_split_index / self.sps,
                 )
 
                 raise ValueError("Inconsistency between chunk time and packet time")
@@ -659,7 +803,7 @@ class Concatenator:
             self.chunk_data_offset += end_split_index - start_split_index
             chunk_time_current = self.chunk_time + (self.chunk_data_offset / self.sps)
 
-            h5_files_list.pop()
+            h5_files_list.popleft()
             log.debug("Data shape: %s", (chunk_data.shape[0], self.chunk_data_offset))
             log.debug("Time till next chunk: %s", self.till_next_chunk)
             log.debug("Time till next day: %s", self.till_next_day)
@@ -686,11 +830,11 @@ class Concatenator:
             log.warning("No new files found in %s", LOCAL_PATH)
             return
         # Check if there is a gap between last chunk and first file
-        first_file_time = h5_files_list[-1][1]
+        first_file_time = h5_files_list[0][2]
 
         if self.carry is not None:
-            time_diff = np.floor(
-                self._get_file_timestamp(first_file_time)
+            time_diff = math.floor(
+                first_file_time
                 - float(
                     previous_chunk_time
                     + (previous_chunk_data_offset / SPS)
@@ -702,8 +846,8 @@ class Concatenator:
                 self.carry = None
 
         while len(h5_files_list) > 0:
-            start_time = datetime.now(tz=pytz.UTC)
-            self._calculate_attrs(h5_files_list[-1][0], h5_files_list[-1][1])
+            start_time = datetime.now(tz=timezone.utc)
+            self._calculate_attrs(*h5_files_list[0])
 
             chunk_data = self._get_chunk_data(
                 previous_chunk_time, previous_chunk_data_offset
@@ -723,7 +867,7 @@ class Concatenator:
             previous_chunk_time = self.chunk_time
             previous_chunk_data_offset = self.chunk_data_offset
             log.info(
-                "Chunk processing time: %s", datetime.now(tz=pytz.UTC) - start_time
+                "Chunk processing time: %s", datetime.now(tz=timezone.utc) - start_time
             )
         return
 
@@ -732,7 +876,7 @@ class Concatenator:
         if SYSTEM_NAME not in ["Mekorot", "Prisma"]:
             raise ValueError("System not supported")
         self.system = SYSTEM_NAME
-        start_time = datetime.now(tz=pytz.UTC)
+        start_time = datetime.now(tz=timezone.utc)
         log.info("Starting concatenation at %s", start_time)
         self._concat_files()
-        log.info("Finished in %s", datetime.now(tz=pytz.UTC) - start_time)
+        log.info("Finished in %s", datetime.now(tz=timezone.utc) - start_time)
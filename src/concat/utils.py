@@ -34,3 +34,24 @@ def multithreaded_mean(arr, num_thread):
     result = np.hstack(list(results))
 
     return result
+
+
+def get_compression_kwargs(compression):
+    # h5py keyword arguments for creating dataset with requested compression
+    # Built-in shuffle filter groups float bytes and improves their compression
+    if compression == "gzip":
+        return {"compression": "gzip", "compression_opts": 4, "shuffle": True}
+    if compression == "lzf":
+        return {"compression": "lzf", "shuffle": True}
+    if compression == "bitshuffle":
+        # Optional dependency, required only for bitshuffle and blosc compression
+        import hdf5plugin
+
+        return dict(hdf5plugin.Bitshuffle(cname="lz4"))
+    if compression == "blosc":
+        import hdf5plugin
+
+        return dict(
+            hdf5plugin.Blosc(cname="zstd", clevel=3, shuffle=hdf5plugin.Blosc.SHUFFLE)
+        )
+    return {}
@@ -15,6 +15,12 @@ CHUNK_SIZE = int(config_dict["CONSTANTS"]["CONCAT_TIME"])
 SPS = int(config_dict["CONSTANTS"]["SPS"])
 DX = float(config_dict["CONSTANTS"]["DX"])
 
+# SAVE CHARACTERISTICS
+# Compression of concatenated chunks (none by default)
+COMPRESSION = config_dict.get("SAVE", "COMPRESSION", fallback="none")
+if COMPRESSION not in ["none", "gzip", "lzf", "bitshuffle", "blosc"]:
+    raise Exception("COMPRESSION is not supported!")
+
 # PATHs to files and save
 LOCALPATH = config_dict["PATH"]["LOCALPATH"]
 NASPATH_final = config_dict["PATH"]["NASPATH_final"]